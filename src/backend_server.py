@@ -4,8 +4,11 @@ import subprocess
 import os
 import threading
 import time
+import math
+import uuid
 import logging
 from typing import Dict, Optional
+from utils.usage_store import UsageStore
 
 app = Flask(__name__)
 logger = logging.getLogger(__name__)
@@ -13,10 +16,84 @@ logger = logging.getLogger(__name__)
 # 存储运行中的 agent 进程
 running_agents: Dict[str, subprocess.Popen] = {}
 
+# drain 时 worker 完成当前通话的默认最长等待时间（秒），与 livekit WorkerOptions.drain_timeout 一致
+DEFAULT_DRAIN_TIMEOUT = 1800
+# drain 截止后再等待进程自行退出的时间，超时则强制杀死
+KILL_GRACE_PERIOD = 10
+# 滚动重启时等待新 worker 完成预热的最长时间
+WARMUP_TIMEOUT = 60
+BACKEND_URL = os.getenv("BACKEND_URL") or "http://localhost:5000"
+
+def parse_drain_timeout(value) -> Optional[float]:
+    """将请求或配置中的 drain_timeout 转换为秒数，非法值抛出 ValueError"""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Invalid drain_timeout: {value!r}")
+    timeout = float(value)
+    if not math.isfinite(timeout) or timeout < 0:
+        raise ValueError(f"Invalid drain_timeout: {value!r}")
+    return timeout
+
+def worker_drain_timeout(config: dict) -> float:
+    """worker 启动时配置给 livekit 的 drain_timeout"""
+    timeout = parse_drain_timeout(config.get("drain_timeout"))
+    return DEFAULT_DRAIN_TIMEOUT if timeout is None else timeout
+
 class AgentManager:
     def __init__(self):
         self.agents = {}
-        self.lock = threading.Lock()
+        # 按 instance_id 索引所有存活的进程，包括正在 drain 的旧进程
+        self.instances = {}
+        self.lock = threading.RLock()
+
+    def _spawn(self, client_id: str, config: dict) -> dict:
+        """启动一个 agent 进程并登记为新实例（调用方需持有锁）"""
+        instance_id = uuid.uuid4().hex
+        # 构造启动命令
+        cmd = [
+            "python", "parameterized_agent.py",  # 修改为你的脚本名称
+            "--client-id", client_id,
+            "--instructions", config.get("instructions", ""),
+            "--transfer-to", config.get("transfer_to", ""),
+            "--client-name", config.get("client_name", ""),
+            "--agent-name", config.get("agent_name", "inbound-agent"),
+        ]
+        
+        # 添加环境变量
+        env = os.environ.copy()
+        if "livekit_url" in config:
+            env["LIVEKIT_URL"] = config["livekit_url"]
+        if "api_key" in config:
+            env["LIVEKIT_API_KEY"] = config["api_key"]
+        if "api_secret" in config:
+            env["LIVEKIT_API_SECRET"] = config["api_secret"]
+        env["AGENT_INSTANCE_ID"] = instance_id
+        env["AGENT_DRAIN_TIMEOUT"] = str(worker_drain_timeout(config))
+        env["BACKEND_URL"] = BACKEND_URL
+        
+        # 启动进程；输出直接继承，避免长时间 drain 时管道写满阻塞 worker
+        process = subprocess.Popen(
+            cmd,
+            env=env,
+        )
+        
+        instance = {
+            "instance_id": instance_id,
+            "client_id": client_id,
+            "process": process,
+            "config": config,
+            "start_time": time.time(),
+            "state": "starting",
+            "ready": threading.Event(),
+            "active_sessions": set(),
+            "drain_started": None,
+            "drain_deadline": None,
+            # 滚动重启预热期间指向替换它的新实例
+            "replaced_by": None,
+        }
+        self.instances[instance_id] = instance
+        return instance
     
     def start_agent(self, client_id: str, config: dict) -> bool:
         """为特定客户启动 agent"""
@@ -26,96 +103,268 @@ class AgentManager:
                 return False
             
             try:
-                # 构造启动命令
-                cmd = [
-                    "python", "parameterized_agent.py",  # 修改为你的脚本名称
-                    "--client-id", client_id,
-                    "--instructions", config.get("instructions", ""),
-                    "--transfer-to", config.get("transfer_to", ""),
-                    "--client-name", config.get("client_name", ""),
-                    "--agent-name", config.get("agent_name", "inbound-agent"),
-                ]
-                
-                # 添加环境变量
-                env = os.environ.copy()
-                if "livekit_url" in config:
-                    env["LIVEKIT_URL"] = config["livekit_url"]
-                if "api_key" in config:
-                    env["LIVEKIT_API_KEY"] = config["api_key"]
-                if "api_secret" in config:
-                    env["LIVEKIT_API_SECRET"] = config["api_secret"]
-                
-                # 启动进程
-                process = subprocess.Popen(
-                    cmd,
-                    env=env,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-                
-                self.agents[client_id] = {
-                    "process": process,
-                    "config": config,
-                    "start_time": time.time()
-                }
-                
-                logger.info(f"Agent started for client {client_id}, PID: {process.pid}")
+                instance = self._spawn(client_id, config)
+                self.agents[client_id] = instance
+                logger.info(f"Agent started for client {client_id}, PID: {instance['process'].pid}")
                 return True
                 
             except Exception as e:
                 logger.error(f"Failed to start agent for {client_id}: {e}")
                 return False
     
-    def stop_agent(self, client_id: str) -> bool:
-        """停止特定客户的 agent"""
+    def stop_agent(self, client_id: str, drain: bool = True, drain_timeout: Optional[float] = None) -> bool:
+        """停止特定客户的 agent
+
+        drain 为 True 时 worker 不再接收新通话，当前通话结束或超过 drain_timeout 后退出；
+        否则立即终止进程。drain_timeout 不能超过 worker 启动时配置的值，
+        否则抛出 ValueError。
+        """
         with self.lock:
             if client_id not in self.agents:
                 return False
             
+            # 滚动重启尚在预热时，被替换的旧 worker 也按本次请求一并停止
+            current = self.agents[client_id]
+            targets = [current] + [
+                instance for instance in self.instances.values()
+                if instance["replaced_by"] == current["instance_id"]
+            ]
+            if drain:
+                for instance in targets:
+                    self._check_drain_timeout(instance, drain_timeout)
+            del self.agents[client_id]
+            for instance in targets:
+                instance["replaced_by"] = None
+
+            if drain:
+                for instance in targets:
+                    self._drain(instance, drain_timeout)
+                return True
+
             try:
-                process = self.agents[client_id]["process"]
-                process.terminate()
-                
-                # 等待进程结束，如果超时则强制杀死
-                try:
-                    process.wait(timeout=10)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                    process.wait()
-                
-                del self.agents[client_id]
+                self._terminate(targets)
                 logger.info(f"Agent stopped for client {client_id}")
                 return True
                 
             except Exception as e:
                 logger.error(f"Failed to stop agent for {client_id}: {e}")
                 return False
+
+    def restart_agent(
+        self,
+        client_id: str,
+        config: Optional[dict] = None,
+        drain_timeout: Optional[float] = None,
+        warmup_timeout: float = WARMUP_TIMEOUT,
+        wait: bool = False,
+    ) -> bool:
+        """滚动重启：先启动并预热新 worker，再 drain 旧 worker，保证容量不降
+
+        drain_timeout 不能超过旧 worker 启动时配置的值，否则抛出 ValueError。
+        """
+        with self.lock:
+            if client_id not in self.agents:
+                return False
+
+            old = self.agents[client_id]
+            self._check_drain_timeout(old, drain_timeout)
+            try:
+                new = self._spawn(client_id, config if config is not None else old["config"])
+            except Exception as e:
+                logger.error(f"Failed to start replacement agent for {client_id}: {e}")
+                return False
+            self.agents[client_id] = new
+            old["replaced_by"] = new["instance_id"]
+            logger.info(
+                f"Replacement agent started for client {client_id}, PID: {new['process'].pid}, "
+                f"old PID: {old['process'].pid}"
+            )
+
+        handoff = threading.Thread(
+            target=self._handoff,
+            args=(old, new, drain_timeout, warmup_timeout),
+            daemon=True,
+        )
+        handoff.start()
+        if wait:
+            handoff.join()
+        return True
+
+    def _handoff(self, old: dict, new: dict, drain_timeout: Optional[float], warmup_timeout: float):
+        """等待新 worker 预热完成后 drain 旧 worker；新 worker 启动失败则保留旧 worker
+
+        预热完成以 worker 上报的 ready 为准（见 utils/backend_report.py，这是近似信号）。
+        若预热期间 agent 已被 stop_agent 停止，旧 worker 已由其处理，这里不再操作。
+        """
+        client_id = old["client_id"]
+        deadline = time.time() + warmup_timeout
+        while not new["ready"].wait(timeout=0.5):
+            if new["process"].poll() is not None or time.time() >= deadline:
+                break
+
+        with self.lock:
+            if old["replaced_by"] != new["instance_id"]:
+                logger.info(
+                    f"Agent for client {client_id} was stopped during warm-up, "
+                    f"handoff from PID {old['process'].pid} cancelled"
+                )
+                return
+            old["replaced_by"] = None
+
+            if new["process"].poll() is not None:
+                logger.error(
+                    f"Replacement agent for client {client_id} exited with code "
+                    f"{new['process'].returncode}, keeping old agent PID {old['process'].pid}"
+                )
+                self.instances.pop(new["instance_id"], None)
+                self.agents[client_id] = old
+                return
+
+            if not new["ready"].is_set():
+                logger.warning(
+                    f"Replacement agent for client {client_id} did not report ready "
+                    f"within {warmup_timeout}s, draining old agent anyway"
+                )
+            self._drain(old, drain_timeout)
+
+    def _check_drain_timeout(self, instance: dict, drain_timeout: Optional[float]):
+        """worker 内部的 livekit drain_timeout 在启动时固定，单次请求只能缩短截止时间"""
+        if drain_timeout is None:
+            return
+        configured = worker_drain_timeout(instance["config"])
+        if drain_timeout > configured:
+            raise ValueError(
+                f"drain_timeout {drain_timeout}s exceeds the worker's configured {configured}s"
+            )
+
+    def _drain(self, instance: dict, drain_timeout: Optional[float]):
+        """让 worker 进入 drain 模式，并在后台等待其退出（调用方需持有锁）"""
+        if drain_timeout is None:
+            drain_timeout = worker_drain_timeout(instance["config"])
+        instance["state"] = "draining"
+        instance["drain_started"] = time.time()
+        instance["drain_deadline"] = instance["drain_started"] + drain_timeout
+        # livekit worker 收到 SIGTERM 后停止接收新任务，并等待当前任务结束（最长 drain_timeout）
+        instance["process"].terminate()
+        logger.info(
+            f"Draining agent for client {instance['client_id']}, PID: {instance['process'].pid}, "
+            f"active sessions: {len(instance['active_sessions'])}, timeout: {drain_timeout}s"
+        )
+        threading.Thread(target=self._wait_drained, args=(instance,), daemon=True).start()
+
+    def _wait_drained(self, instance: dict):
+        process = instance["process"]
+        timeout = instance["drain_deadline"] - time.time() + KILL_GRACE_PERIOD
+        try:
+            process.wait(timeout=max(0, timeout))
+        except subprocess.TimeoutExpired:
+            logger.warning(
+                f"Agent for client {instance['client_id']} PID {process.pid} still has "
+                f"{len(instance['active_sessions'])} active sessions after drain deadline, killing"
+            )
+            process.kill()
+            process.wait()
+
+        with self.lock:
+            instance["state"] = "stopped"
+            self.instances.pop(instance["instance_id"], None)
+        logger.info(f"Agent drained for client {instance['client_id']}, PID: {process.pid}")
+
+    def _terminate(self, instances: list):
+        """立即终止一组 worker，共用同一个 KILL_GRACE_PERIOD（调用方需持有锁）"""
+        for instance in instances:
+            instance["process"].terminate()
+        
+        # 等待进程结束，如果超时则强制杀死
+        deadline = time.time() + KILL_GRACE_PERIOD
+        for instance in instances:
+            process = instance["process"]
+            try:
+                process.wait(timeout=max(0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+            instance["state"] = "stopped"
+            self.instances.pop(instance["instance_id"], None)
+
+    def report(self, instance_id: str, event: str, room: str = "") -> bool:
+        """记录 worker 上报的生命周期事件"""
+        with self.lock:
+            instance = self.instances.get(instance_id)
+            if instance is None:
+                return False
+
+            if event == "ready":
+                if instance["state"] == "starting":
+                    instance["state"] = "running"
+                instance["ready"].set()
+            elif event == "session_started":
+                instance["active_sessions"].add(room)
+            elif event == "session_ended":
+                instance["active_sessions"].discard(room)
+            else:
+                raise ValueError(f"Unknown event: {event}")
+            return True
+
+    def _instance_status(self, instance: dict) -> dict:
+        process = instance["process"]
+        return {
+            "instance_id": instance["instance_id"],
+            "pid": process.pid,
+            "status": instance["state"] if process.poll() is None else "stopped",
+            "start_time": instance["start_time"],
+            "active_sessions": len(instance["active_sessions"]),
+            "drain_deadline": instance["drain_deadline"],
+            "replaced_by": instance["replaced_by"],
+        }
+
+    def _draining_status(self, client_id: str) -> list:
+        return [
+            self._instance_status(instance)
+            for instance in self.instances.values()
+            if instance["client_id"] == client_id and instance["state"] == "draining"
+        ]
+
+    def _replacing_status(self, client_id: str) -> list:
+        """滚动重启预热期间仍在服务的旧 worker"""
+        return [
+            self._instance_status(instance)
+            for instance in self.instances.values()
+            if instance["client_id"] == client_id and instance["replaced_by"]
+        ]
     
     def get_agent_status(self, client_id: str) -> Optional[dict]:
         """获取 agent 状态"""
         with self.lock:
+            draining = self._draining_status(client_id)
             if client_id not in self.agents:
-                return None
+                if not draining:
+                    return None
+                return {"client_id": client_id, "status": "draining", "draining": draining}
             
             agent_info = self.agents[client_id]
-            process = agent_info["process"]
             
             return {
                 "client_id": client_id,
-                "pid": process.pid,
-                "status": "running" if process.poll() is None else "stopped",
-                "start_time": agent_info["start_time"],
-                "config": agent_info["config"]
+                **self._instance_status(agent_info),
+                "config": agent_info["config"],
+                "replacing": self._replacing_status(client_id),
+                "draining": draining,
             }
     
     def list_agents(self) -> list:
         """列出所有 agent"""
         with self.lock:
-            return [self.get_agent_status(cid) for cid in self.agents.keys()]
+            client_ids = set(self.agents) | {i["client_id"] for i in self.instances.values()}
+            return [self.get_agent_status(cid) for cid in sorted(client_ids)]
 
 # 全局 agent 管理器
 agent_manager = AgentManager()
 
+# 通话用量汇总存储，由各 worker 在通话结束时写入
+usage_store = UsageStore()
+
 @app.route('/agent/start', methods=['POST'])
 def start_agent():
     """启动 agent 的 API 端点"""
@@ -138,17 +387,68 @@ def stop_agent():
     """停止 agent 的 API 端点"""
     data = request.json
     client_id = data.get('client_id')
+    drain = data.get('drain', True)
     
     if not client_id:
         return jsonify({"error": "client_id is required"}), 400
+    if not isinstance(drain, bool):
+        return jsonify({"error": "drain must be a boolean"}), 400
     
-    success = agent_manager.stop_agent(client_id)
+    try:
+        drain_timeout = parse_drain_timeout(data.get('drain_timeout'))
+        success = agent_manager.stop_agent(client_id, drain=drain, drain_timeout=drain_timeout)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     if success:
-        return jsonify({"message": f"Agent stopped for client {client_id}"}), 200
+        action = "draining" if drain else "stopped"
+        return jsonify({"message": f"Agent {action} for client {client_id}"}), 200
     else:
         return jsonify({"error": "Agent not found or failed to stop"}), 404
 
+@app.route('/agent/restart', methods=['POST'])
+def restart_agent():
+    """滚动重启 agent（可附带新配置），旧 worker drain 期间不中断通话"""
+    data = request.json
+    client_id = data.get('client_id')
+    
+    if not client_id:
+        return jsonify({"error": "client_id is required"}), 400
+    
+    try:
+        success = agent_manager.restart_agent(
+            client_id,
+            config=data.get('config'),
+            drain_timeout=parse_drain_timeout(data.get('drain_timeout')),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if success:
+        return jsonify({"message": f"Agent restarting for client {client_id}"}), 200
+    else:
+        return jsonify({"error": "Agent not found or failed to restart"}), 404
+
+@app.route('/agent/report', methods=['POST'])
+def report_agent_event():
+    """worker 上报生命周期事件（ready / session_started / session_ended）"""
+    data = request.json
+    instance_id = data.get('instance_id')
+    event = data.get('event')
+    
+    if not instance_id or not event:
+        return jsonify({"error": "instance_id and event are required"}), 400
+    
+    try:
+        success = agent_manager.report(instance_id, event, room=data.get('room', ''))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if success:
+        return jsonify({"message": "ok"}), 200
+    else:
+        return jsonify({"error": "Agent instance not found"}), 404
+
 @app.route('/agent/status/<client_id>', methods=['GET'])
 def get_agent_status(client_id):
     """获取特定 agent 的状态"""
@@ -165,5 +465,22 @@ def list_agents():
     agents = agent_manager.list_agents()
     return jsonify({"agents": agents}), 200
 
+@app.route('/usage', methods=['GET'])
+def get_usage():
+    """按客户、日期范围、provider 查询汇总用量"""
+    group_by = request.args.get('group_by', 'client,day,provider')
+    try:
+        rows = usage_store.query(
+            client_id=request.args.get('client_id'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            provider=request.args.get('provider'),
+            group_by=[key for key in group_by.split(',') if key],
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"usage": rows}), 200
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
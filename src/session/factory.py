@@ -1,6 +1,13 @@
 from livekit.agents import AgentSession
 from livekit.plugins import assemblyai, elevenlabs, anthropic
 
+# provider names used when recording usage, keep in sync with create_session
+SESSION_PROVIDERS = {
+    "llm": "anthropic",
+    "stt": "assemblyai",
+    "tts": "elevenlabs",
+}
+
 def create_session(vad) -> AgentSession:
     return AgentSession(
         llm=anthropic.LLM(model="claude-sonnet-4-20250514"),
@@ -0,0 +1,38 @@
+import json
+import logging
+import os
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+# set by backend_server.AgentManager when it spawns a worker
+BACKEND_URL = os.getenv("BACKEND_URL") or "http://localhost:5000"
+AGENT_INSTANCE_ID = os.getenv("AGENT_INSTANCE_ID", "")
+DRAIN_TIMEOUT = float(os.getenv("AGENT_DRAIN_TIMEOUT") or 1800)
+
+
+def report_event(event: str, **fields):
+    """Report a worker lifecycle event (ready, session_started, session_ended) to backend_server
+
+    ``ready`` is sent from prewarm, which runs in each idle job process rather
+    than the main worker process, so it fires once per process and only means
+    a process has warmed up, not that the worker has registered with LiveKit.
+    cli.run_app does not expose the registration, so backend_server treats the
+    first ``ready`` as an approximate warm-up signal; repeats are harmless.
+    """
+    if not AGENT_INSTANCE_ID:
+        # worker was not started by backend_server, nothing to report to
+        return
+
+    data = json.dumps({"instance_id": AGENT_INSTANCE_ID, "event": event, **fields}).encode()
+    req = urllib.request.Request(
+        f"{BACKEND_URL}/agent/report",
+        data=data,
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=2) as resp:
+            resp.read()
+    except Exception as e:
+        logger.warning(f"Failed to report {event} to backend: {e}")
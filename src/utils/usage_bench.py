@@ -0,0 +1,98 @@
+"""Benchmark for the usage store: ingest and query millions of call records.
+
+Run from ``src/``::
+
+    python -m utils.usage_bench --records 1000000 --clients 500 --days 90
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from utils.usage_store import UsageStore
+
+PROVIDERS = {"llm": "anthropic", "stt": "assemblyai", "tts": "elevenlabs"}
+
+
+def generate_records(count: int, clients: int, days: int, seed: int = 0):
+    rng = random.Random(seed)
+    now = time.time()
+    for i in range(count):
+        call_seconds = rng.uniform(10, 600)
+        yield {
+            "client_id": f"client_{rng.randrange(clients)}",
+            "room": f"call-{i}",
+            "ts": now - rng.uniform(0, days * 86400),
+            "call_seconds": call_seconds,
+            "usage": {
+                PROVIDERS["llm"]: {
+                    "llm_prompt_tokens": rng.randrange(500, 20000),
+                    "llm_completion_tokens": rng.randrange(50, 2000),
+                },
+                PROVIDERS["stt"]: {"stt_audio_duration": call_seconds * 0.6},
+                PROVIDERS["tts"]: {"tts_characters_count": rng.randrange(100, 5000)},
+            },
+        }
+
+
+def batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run(records: int, clients: int, days: int, batch_size: int, path: str):
+    store = UsageStore(path)
+
+    start = time.perf_counter()
+    for batch in batched(generate_records(records, clients, days), batch_size):
+        store.append_many(batch)
+    ingest = time.perf_counter() - start
+    print(f"ingest: {records} records in {ingest:.2f}s ({records / ingest:,.0f} records/s)")
+
+    queries = {
+        "one client, all days": lambda: store.query(client_id="client_0"),
+        "one client, 30 day range, per provider": lambda: store.query(
+            client_id="client_0",
+            start=time.strftime("%Y-%m-%d", time.gmtime(time.time() - 30 * 86400)),
+            group_by=("provider",),
+        ),
+        "all clients, llm only, per client": lambda: store.query(
+            provider=PROVIDERS["llm"], group_by=("client",)
+        ),
+        "all clients, per day": lambda: store.query(group_by=("day",)),
+    }
+    for name, fn in queries.items():
+        start = time.perf_counter()
+        rows = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"query [{name}]: {len(rows)} rows in {elapsed:.1f}ms")
+
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Usage store ingest/query benchmark")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--db", default="", help="Database path (default: temp file)")
+    args = parser.parse_args()
+
+    if args.db:
+        run(args.records, args.clients, args.days, args.batch_size, args.db)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run(args.records, args.clients, args.days, args.batch_size, os.path.join(tmp, "usage.db"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH") or "usage.db"
+
+# Fields copied from livekit's UsageSummary, keyed by the provider they are billed to.
+SUMMARY_FIELDS = {
+    "llm": ["llm_prompt_tokens", "llm_prompt_cached_tokens", "llm_completion_tokens"],
+    "stt": ["stt_audio_duration"],
+    "tts": ["tts_characters_count", "tts_audio_duration"],
+}
+
+# Pseudo provider used for per-call counters in the rollup table.
+CALL_PROVIDER = "call"
+
+GROUP_BY_COLUMNS = {
+    "day": "day",
+    "client": "client_id",
+    "provider": "provider",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_records (
+    id INTEGER PRIMARY KEY,
+    client_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    ts REAL NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_records_day ON usage_records (day, client_id);
+CREATE TABLE IF NOT EXISTS usage_rollup (
+    client_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value NUMERIC NOT NULL,
+    PRIMARY KEY (client_id, day, provider, metric)
+) WITHOUT ROWID;
+-- covering index so cross-client day-range queries never touch the table
+CREATE INDEX IF NOT EXISTS usage_rollup_day ON usage_rollup (day, provider, metric, value);
+"""
+
+_UPSERT_ROLLUP = """
+INSERT INTO usage_rollup (client_id, day, provider, metric, value)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (client_id, day, provider, metric)
+DO UPDATE SET value = value + excluded.value
+"""
+
+
+def day_bucket(ts: float) -> str:
+    """UTC day bucket (YYYY-MM-DD) for a unix timestamp"""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def build_usage_record(
+    client_id: str,
+    room: str,
+    summary,
+    providers: dict,
+    started_at: float,
+    ended_at: Optional[float] = None,
+) -> dict:
+    """Turn a UsageCollector summary into a compact per-call usage record"""
+    ended_at = ended_at if ended_at is not None else time.time()
+    usage = {}
+    for kind, fields in SUMMARY_FIELDS.items():
+        provider = providers.get(kind, kind)
+        metrics = usage.setdefault(provider, {})
+        for field in fields:
+            value = getattr(summary, field, 0) or 0
+            if value:
+                metrics[field] = metrics.get(field, 0) + value
+
+    return {
+        "client_id": client_id,
+        "room": room,
+        "ts": ended_at,
+        "call_seconds": max(0.0, ended_at - started_at),
+        "usage": {provider: m for provider, m in usage.items() if m},
+    }
+
+
+def save_usage_record(record: dict, path: Optional[str] = None):
+    """Append one record through a short-lived connection, as each job runs in its own process"""
+    store = UsageStore(path or USAGE_DB_PATH)
+    try:
+        store.append(record)
+    finally:
+        store.close()
+
+
+async def save_job_usage(
+    client_id: str,
+    room: str,
+    summary,
+    providers: dict,
+    started_at: float,
+):
+    """Shutdown callback body shared by the workers: record a finished job's usage"""
+    record = build_usage_record(
+        client_id=client_id,
+        room=room,
+        summary=summary,
+        providers=providers,
+        started_at=started_at,
+    )
+    try:
+        await asyncio.to_thread(save_usage_record, record)
+    except Exception as e:
+        logger.error(f"{client_id} failed to save usage record for room {room}: {e}")
+
+
+def _parse_day(value: str, name: str) -> str:
+    # strptime accepts unpadded "2024-1-5", which would not sort correctly against day buckets
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        day = None
+    if day != value:
+        raise ValueError(f"{name} must be a YYYY-MM-DD date, got {value!r}")
+    return day
+
+
+def _rollup_rows(record: dict, day: str) -> list:
+    client_id = record["client_id"]
+    rows = [
+        (client_id, day, CALL_PROVIDER, "calls", 1),
+        (client_id, day, CALL_PROVIDER, "call_seconds", record.get("call_seconds", 0)),
+    ]
+    for provider, metrics in record.get("usage", {}).items():
+        for metric, value in metrics.items():
+            rows.append((client_id, day, provider, metric, value))
+    return rows
+
+
+class UsageStore:
+    """Append-only store of per-call usage records with daily rollups.
+
+    Raw records are only ever appended; every append also bumps the matching
+    (client_id, day, provider, metric) rollup row in the same transaction, so
+    aggregate queries never have to read the raw records.
+    """
+
+    def __init__(self, path: str = USAGE_DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def append(self, record: dict):
+        """Append a single call usage record"""
+        self.append_many([record])
+
+    def append_many(self, records: Iterable[dict]):
+        """Append call usage records and incrementally update the daily rollups"""
+        raw_rows = []
+        rollup = {}
+        for record in records:
+            day = day_bucket(record["ts"])
+            raw_rows.append(
+                (record["client_id"], day, record["ts"], json.dumps(record, separators=(",", ":")))
+            )
+            # merge rollups within the batch first so each key is upserted once
+            for client_id, d, provider, metric, value in _rollup_rows(record, day):
+                key = (client_id, d, provider, metric)
+                rollup[key] = rollup.get(key, 0) + value
+
+        if not raw_rows:
+            return
+
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO usage_records (client_id, day, ts, record) VALUES (?, ?, ?, ?)",
+                raw_rows,
+            )
+            self.conn.executemany(
+                _UPSERT_ROLLUP, [(*key, value) for key, value in rollup.items()]
+            )
+
+    def query(
+        self,
+        client_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        provider: Optional[str] = None,
+        group_by: Iterable[str] = ("client", "day", "provider"),
+    ) -> list:
+        """Aggregate usage by client, day range and provider.
+
+        Only the rollup table is read. ``start``/``end`` are inclusive
+        YYYY-MM-DD days; malformed days or ``start > end`` raise ValueError.
+        """
+        if start:
+            start = _parse_day(start, "start")
+        if end:
+            end = _parse_day(end, "end")
+        if start and end and start > end:
+            raise ValueError(f"start {start} is after end {end}")
+
+        group_cols = []
+        for key in group_by:
+            if key not in GROUP_BY_COLUMNS:
+                raise ValueError(f"Unknown group_by key: {key}")
+            group_cols.append(GROUP_BY_COLUMNS[key])
+
+        where, params = [], []
+        if client_id:
+            where.append("client_id = ?")
+            params.append(client_id)
+        if start:
+            where.append("day >= ?")
+            params.append(start)
+        if end:
+            where.append("day <= ?")
+            params.append(end)
+        if provider:
+            where.append("provider = ?")
+            params.append(provider)
+
+        select_cols = [*group_cols]
+        if "provider" not in select_cols:
+            select_cols.append("provider")
+        select_cols.append("metric")
+        sql = f"SELECT {', '.join(select_cols)}, SUM(value) FROM usage_rollup"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" GROUP BY {', '.join(select_cols)} ORDER BY {', '.join(select_cols)}"
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        results = {}
+        for row in rows:
+            columns = dict(zip(select_cols, row))
+            key = tuple(columns[col] for col in group_cols)
+            if key not in results:
+                results[key] = {**{col: columns[col] for col in group_cols}, "usage": {}}
+            usage = results[key]["usage"].setdefault(columns["provider"], {})
+            usage[columns["metric"]] = row[-1]
+        return list(results.values())
+
+    def record_count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM usage_records").fetchone()[0]
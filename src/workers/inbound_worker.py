@@ -1,6 +1,6 @@
 import logging
 from livekit.agents import JobContext, WorkerOptions, cli, JobProcess, RoomInputOptions
-from session.factory import create_session
+from session.factory import create_session, SESSION_PROVIDERS
 from agent.assistant import Assistant
 from livekit.plugins import silero, noise_cancellation
 
@@ -20,7 +20,11 @@ from livekit.plugins import  noise_cancellation, silero
 from livekit.agents import UserStateChangedEvent, AgentStateChangedEvent
 from livekit.plugins import silero
 import argparse
+import asyncio
+import time
 from functools import partial
+from utils.usage_store import save_job_usage
+from utils.backend_report import DRAIN_TIMEOUT, report_event
 load_dotenv(".env.local")
 
 
@@ -42,6 +46,8 @@ def parse_arguments():
 def prewarm(proc: JobProcess, client_config: dict):
     proc.userdata["vad"] = silero.VAD.load()
     proc.userdata["client_config"] = client_config
+    # approximate warm-up signal for rolling restarts, see report_event
+    report_event("ready")
 
 
 async def entrypoint(ctx: JobContext):
@@ -57,7 +63,20 @@ async def entrypoint(ctx: JobContext):
         "client_id": client_id,
 
     }
+
+    # backend_server counts active sessions from these reports while draining
+    # fire and forget so a slow backend never delays answering the call
+    session_report = asyncio.create_task(
+        asyncio.to_thread(report_event, "session_started", room=ctx.room.name)
+    )
+
+    async def report_session_ended():
+        await session_report
+        await asyncio.to_thread(report_event, "session_ended", room=ctx.room.name)
+
+    ctx.add_shutdown_callback(report_session_ended)
     session = create_session(vad=ctx.proc.userdata["vad"])
+    started_at = time.time()
     
     usage_collector = metrics.UsageCollector()
 
@@ -94,6 +113,7 @@ async def entrypoint(ctx: JobContext):
     async def log_usage():
         summary = usage_collector.get_summary()
         logger.info(f"Usage: {summary}")
+        await save_job_usage(client_id, ctx.room.name, summary, SESSION_PROVIDERS, started_at)
 
     ctx.add_shutdown_callback(log_usage)
 
@@ -148,6 +168,7 @@ def main():
             entrypoint_fnc=entrypoint,
             prewarm_fnc=partial(prewarm, client_config=CLIENT_CONFIG),
             agent_name=args["agent_name"],
+            drain_timeout=DRAIN_TIMEOUT,
         )
     )
 
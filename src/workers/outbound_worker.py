@@ -3,13 +3,17 @@ import json
 import logging
 import os
 import argparse
+import time
 from livekit import api
 from livekit.agents import JobContext, WorkerOptions, cli, JobProcess, RoomInputOptions
+from livekit.agents import MetricsCollectedEvent, metrics
 from livekit.plugins import silero, noise_cancellation
 
-from session.factory import create_session
+from session.factory import create_session, SESSION_PROVIDERS
 from agent.assistant import Assistant
 from functools import partial
+from utils.backend_report import DRAIN_TIMEOUT, report_event
+from utils.usage_store import save_job_usage
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -31,10 +35,24 @@ def parse_arguments():
 def prewarm(proc: JobProcess, client_config: dict):
     proc.userdata["vad"] = silero.VAD.load()
     proc.userdata["client_config"] = client_config
+    # approximate warm-up signal for rolling restarts, see report_event
+    report_event("ready")
 
 
 async def entrypoint(ctx: JobContext):
     logger.info(f"[outbound] connecting to room {ctx.room.name}")
+
+    # backend_server counts active sessions from these reports while draining
+    # fire and forget so a slow backend never delays answering the call
+    session_report = asyncio.create_task(
+        asyncio.to_thread(report_event, "session_started", room=ctx.room.name)
+    )
+
+    async def report_session_ended():
+        await session_report
+        await asyncio.to_thread(report_event, "session_ended", room=ctx.room.name)
+
+    ctx.add_shutdown_callback(report_session_ended)
     await ctx.connect()
     
     client_config = ctx.proc.userdata.get("client_config", {})
@@ -54,6 +72,21 @@ async def entrypoint(ctx: JobContext):
 
     
     session = create_session(vad=ctx.proc.userdata["vad"])
+    started_at = time.time()
+
+    usage_collector = metrics.UsageCollector()
+
+    @session.on("metrics_collected")
+    def _on_metrics_collected(ev: MetricsCollectedEvent):
+        metrics.log_metrics(ev.metrics)
+        usage_collector.collect(ev.metrics)
+
+    async def log_usage():
+        summary = usage_collector.get_summary()
+        logger.info(f"Usage: {summary}")
+        await save_job_usage(client_id, ctx.room.name, summary, SESSION_PROVIDERS, started_at)
+
+    ctx.add_shutdown_callback(log_usage)
 
     session_started = asyncio.create_task(
         session.start(
@@ -127,6 +160,7 @@ def main():
             entrypoint_fnc=entrypoint,
             prewarm_fnc=partial(prewarm, client_config=CLIENT_CONFIG),
             agent_name=args["agent_name"],
+            drain_timeout=DRAIN_TIMEOUT,
         )
     )
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+# keep the module-level usage store out of the working directory
+os.environ.setdefault("USAGE_DB_PATH", ":memory:")
+
+import backend_server  # noqa: E402
+
+# Simulated worker: on SIGTERM it keeps its "active call" running for
+# SIM_SESSION_SECONDS before exiting, like a livekit worker draining a job.
+# Once the handler is installed it touches SIM_READY_DIR/<AGENT_INSTANCE_ID>.
+WORKER_SCRIPT = """
+import os, signal, sys, time
+
+def drain(*_):
+    time.sleep(float(os.environ["SIM_SESSION_SECONDS"]))
+    sys.exit(0)
+
+signal.signal(signal.SIGTERM, drain)
+open(os.path.join(os.environ["SIM_READY_DIR"], os.environ["AGENT_INSTANCE_ID"]), "w").close()
+while True:
+    time.sleep(0.05)
+"""
+
+CRASHING_WORKER_SCRIPT = "import sys; sys.exit(3)"
+
+
+@pytest.fixture
+def spawned(monkeypatch, tmp_path):
+    """Replace the agent command with simulated workers; returns the scripts to run, in order"""
+    scripts = []
+    real_popen = subprocess.Popen
+
+    def fake_popen(cmd, env=None, **kwargs):
+        script = scripts.pop(0) if scripts else WORKER_SCRIPT
+        return real_popen([sys.executable, "-c", script], env=env)
+
+    monkeypatch.setattr(backend_server.subprocess, "Popen", fake_popen)
+    monkeypatch.setenv("SIM_READY_DIR", str(tmp_path))
+    monkeypatch.setenv("SIM_SESSION_SECONDS", "60")
+    return scripts
+
+
+@pytest.fixture
+def manager(spawned):
+    manager = backend_server.AgentManager()
+    yield manager
+    with manager.lock:
+        instances = list(manager.instances.values()) + list(manager.agents.values())
+    for instance in instances:
+        if instance["process"].poll() is None:
+            instance["process"].kill()
+            instance["process"].wait()
+
+
+def wait_for(predicate, timeout: float = 5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def wait_until_handler_installed(instance: dict):
+    ready_file = os.path.join(os.environ["SIM_READY_DIR"], instance["instance_id"])
+    assert wait_for(lambda: os.path.exists(ready_file), timeout=30)
+
+
+def test_restart_drains_old_instance_and_keeps_sessions(manager, monkeypatch):
+    monkeypatch.setenv("SIM_SESSION_SECONDS", "2")
+
+    assert manager.start_agent("c1", {"drain_timeout": 10})
+    old = manager.agents["c1"]
+    wait_until_handler_installed(old)
+    manager.report(old["instance_id"], "ready")
+    manager.report(old["instance_id"], "session_started", room="call-1")
+
+    assert manager.restart_agent("c1", warmup_timeout=5)
+    new = manager.agents["c1"]
+    assert new is not old
+    manager.report(new["instance_id"], "ready")
+
+    assert wait_for(lambda: old["state"] == "draining")
+    status = manager.get_agent_status("c1")
+    assert status["instance_id"] == new["instance_id"]
+    assert status["status"] == "running"
+    [draining] = status["draining"]
+    assert draining["instance_id"] == old["instance_id"]
+    assert draining["active_sessions"] == 1
+    # the long-running call is still being served
+    assert old["process"].poll() is None
+
+    manager.report(old["instance_id"], "session_ended", room="call-1")
+    assert old["process"].wait(timeout=5) == 0
+    assert wait_for(lambda: old["instance_id"] not in manager.instances)
+    assert manager.get_agent_status("c1")["draining"] == []
+    assert new["process"].poll() is None
+
+
+def test_drain_kills_process_after_deadline(manager, monkeypatch):
+    monkeypatch.setattr(backend_server, "KILL_GRACE_PERIOD", 0.5)
+
+    assert manager.start_agent("c1", {"drain_timeout": 0.5})
+    instance = manager.agents["c1"]
+    manager.report(instance["instance_id"], "session_started", room="call-1")
+    wait_until_handler_installed(instance)
+
+    assert manager.stop_agent("c1")
+    assert instance["state"] == "draining"
+    assert wait_for(lambda: instance["process"].poll() is not None, timeout=5)
+    killed_at = time.time()
+
+    assert instance["process"].returncode == -signal.SIGKILL
+    assert killed_at >= instance["drain_deadline"] + backend_server.KILL_GRACE_PERIOD
+    assert wait_for(lambda: manager.get_agent_status("c1") is None)
+
+
+def test_failed_replacement_restores_old_instance(manager, spawned):
+    assert manager.start_agent("c1", {})
+    old = manager.agents["c1"]
+    manager.report(old["instance_id"], "session_started", room="call-1")
+
+    spawned.append(CRASHING_WORKER_SCRIPT)
+    assert manager.restart_agent("c1", warmup_timeout=5, wait=True)
+
+    assert manager.agents["c1"] is old
+    assert old["state"] == "starting"
+    assert old["process"].poll() is None
+    assert len(manager.instances) == 1
+    assert manager.get_agent_status("c1")["active_sessions"] == 1
+
+
+def test_stop_during_warmup_stops_old_and_new(manager, monkeypatch):
+    monkeypatch.setattr(backend_server, "KILL_GRACE_PERIOD", 1)
+
+    assert manager.start_agent("c1", {})
+    old = manager.agents["c1"]
+    manager.report(old["instance_id"], "ready")
+    manager.report(old["instance_id"], "session_started", room="call-1")
+
+    assert manager.restart_agent("c1", warmup_timeout=30)
+    new = manager.agents["c1"]
+    wait_until_handler_installed(old)
+    wait_until_handler_installed(new)
+
+    # the old worker is still visible while the replacement warms up
+    [replacing] = manager.get_agent_status("c1")["replacing"]
+    assert replacing["instance_id"] == old["instance_id"]
+    assert replacing["replaced_by"] == new["instance_id"]
+
+    started = time.time()
+    assert manager.stop_agent("c1", drain=False)
+    assert time.time() - started <= backend_server.KILL_GRACE_PERIOD + 0.5
+    assert old["process"].poll() is not None
+    assert new["process"].poll() is not None
+
+    # the handoff thread must not bring the old worker back or drain it
+    time.sleep(1)
+    assert "c1" not in manager.agents
+    assert manager.instances == {}
+    assert old["state"] == "stopped"
+    assert manager.get_agent_status("c1") is None
+
+
+def test_stop_rejects_drain_timeout_above_worker_config(manager):
+    assert manager.start_agent("c1", {"drain_timeout": 60})
+
+    with pytest.raises(ValueError):
+        manager.stop_agent("c1", drain_timeout=120)
+    assert "c1" in manager.agents
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"client_id": "c1", "drain_timeout": "soon"},
+        {"client_id": "c1", "drain_timeout": -1},
+        {"client_id": "c1", "drain": "false"},
+    ],
+)
+def test_stop_endpoint_validates_input(manager, monkeypatch, body):
+    monkeypatch.setattr(backend_server, "agent_manager", manager)
+    assert manager.start_agent("c1", {})
+
+    resp = backend_server.app.test_client().post("/agent/stop", json=body)
+
+    assert resp.status_code == 400
+    assert manager.agents["c1"]["state"] == "starting"
+    assert manager.agents["c1"]["process"].poll() is None
@@ -0,0 +1,192 @@
+import json
+import os
+
+import pytest
+
+# keep the module-level usage store out of the working directory
+os.environ.setdefault("USAGE_DB_PATH", ":memory:")
+
+import backend_server  # noqa: E402
+from utils.usage_store import (  # noqa: E402
+    CALL_PROVIDER,
+    UsageStore,
+    build_usage_record,
+    day_bucket,
+    save_usage_record,
+)
+
+DAY = 86400
+PROVIDERS = {"llm": "anthropic", "stt": "assemblyai", "tts": "elevenlabs"}
+
+
+class Summary:
+    llm_prompt_tokens = 100
+    llm_prompt_cached_tokens = 0
+    llm_completion_tokens = 5
+    stt_audio_duration = 3.5
+    tts_characters_count = 40
+    tts_audio_duration = 2.0
+
+
+def make_record(client_id: str, day: int, seconds: float = 60):
+    ended_at = day * DAY + 3600
+    return build_usage_record(
+        client_id=client_id,
+        room=f"{client_id}-{day}",
+        summary=Summary(),
+        providers=PROVIDERS,
+        started_at=ended_at - seconds,
+        ended_at=ended_at,
+    )
+
+
+@pytest.fixture
+def store():
+    store = UsageStore(":memory:")
+    yield store
+    store.close()
+
+
+def raw_totals(store: UsageStore) -> dict:
+    """Rebuild the rollups from the raw records"""
+    totals = {}
+    for day, record in store.conn.execute("SELECT day, record FROM usage_records"):
+        record = json.loads(record)
+        client_id = record["client_id"]
+        rows = [
+            (CALL_PROVIDER, "calls", 1),
+            (CALL_PROVIDER, "call_seconds", record["call_seconds"]),
+        ]
+        rows += [
+            (provider, metric, value)
+            for provider, metrics in record["usage"].items()
+            for metric, value in metrics.items()
+        ]
+        for provider, metric, value in rows:
+            key = (client_id, day, provider, metric)
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def rollup_totals(store: UsageStore) -> dict:
+    totals = {}
+    for row in store.query(group_by=("client", "day", "provider")):
+        for provider, metrics in row["usage"].items():
+            for metric, value in metrics.items():
+                totals[(row["client_id"], row["day"], provider, metric)] = value
+    return totals
+
+
+def test_rollups_match_raw_records_after_repeated_appends(store):
+    # duplicate keys within one batch exercise the in-batch merge
+    store.append_many([make_record("a", 0), make_record("a", 0), make_record("b", 1)])
+    store.append(make_record("a", 0, seconds=30))
+    store.append_many([make_record("a", 1), make_record("b", 1)])
+    store.append_many([])
+
+    assert store.record_count() == 6
+    assert rollup_totals(store) == pytest.approx(raw_totals(store))
+
+    day0 = day_bucket(0)
+    [row] = store.query(client_id="a", start=day0, end=day0, group_by=("client", "day"))
+    assert row["usage"][CALL_PROVIDER] == {"calls": 3, "call_seconds": 150}
+    assert row["usage"]["anthropic"]["llm_prompt_tokens"] == 300
+
+
+def test_count_metrics_stay_integers(store):
+    store.append(make_record("a", 0))
+    store.append(make_record("a", 0))
+
+    [row] = store.query(group_by=())
+    assert row["usage"]["anthropic"]["llm_prompt_tokens"] == 200
+    assert isinstance(row["usage"]["anthropic"]["llm_prompt_tokens"], int)
+    assert isinstance(row["usage"][CALL_PROVIDER]["calls"], int)
+    assert row["usage"]["assemblyai"]["stt_audio_duration"] == 7.0
+
+
+def test_query_filters_by_range_and_provider(store):
+    store.append_many([make_record("a", day) for day in range(5)])
+    store.append(make_record("b", 2))
+
+    rows = store.query(start=day_bucket(1 * DAY), end=day_bucket(3 * DAY), group_by=("day",))
+    assert [row["day"] for row in rows] == [day_bucket(d * DAY) for d in (1, 2, 3)]
+    assert rows[1]["usage"][CALL_PROVIDER]["calls"] == 2
+
+    rows = store.query(provider="elevenlabs", group_by=("client",))
+    assert [row["client_id"] for row in rows] == ["a", "b"]
+    assert all(list(row["usage"]) == ["elevenlabs"] for row in rows)
+    assert rows[0]["usage"]["elevenlabs"]["tts_characters_count"] == 200
+
+
+def test_query_without_group_by_returns_single_total(store):
+    store.append_many([make_record("a", 0), make_record("b", 1)])
+
+    rows = store.query(group_by=[])
+    assert len(rows) == 1
+    assert rows[0]["usage"][CALL_PROVIDER]["calls"] == 2
+
+    assert store.query(client_id="missing", group_by=[]) == []
+
+
+def test_unknown_group_by_raises(store):
+    with pytest.raises(ValueError):
+        store.query(group_by=("client", "tenant"))
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        ("garbage", None),
+        ("2024-1-5", None),
+        (None, "2024-02-30"),
+        ("2024-03-02", "2024-03-01"),
+    ],
+)
+def test_query_rejects_invalid_day_range(store, start, end):
+    with pytest.raises(ValueError):
+        store.query(start=start, end=end)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        "start=garbage",
+        "start=2024-1-5",
+        "start=2024-03-02&end=2024-03-01",
+        "group_by=tenant",
+    ],
+)
+def test_usage_endpoint_returns_400_on_bad_query(store, monkeypatch, params):
+    monkeypatch.setattr(backend_server, "usage_store", store)
+
+    resp = backend_server.app.test_client().get(f"/usage?{params}")
+
+    assert resp.status_code == 400
+    assert "error" in resp.get_json()
+
+
+def test_usage_endpoint_filters_by_client_and_range(store, monkeypatch):
+    monkeypatch.setattr(backend_server, "usage_store", store)
+    store.append_many([make_record("a", day) for day in range(3)] + [make_record("b", 1)])
+
+    day1 = day_bucket(1 * DAY)
+    resp = backend_server.app.test_client().get(
+        f"/usage?client_id=a&start={day1}&end={day1}&group_by=client"
+    )
+
+    assert resp.status_code == 200
+    assert resp.get_json()["usage"][0]["usage"][CALL_PROVIDER]["calls"] == 1
+
+
+def test_save_usage_record_appends_to_file_store(tmp_path):
+    path = str(tmp_path / "usage.db")
+    save_usage_record(make_record("a", 0), path=path)
+    save_usage_record(make_record("a", 0), path=path)
+
+    store = UsageStore(path)
+    try:
+        assert store.record_count() == 2
+        [row] = store.query(group_by=())
+        assert row["usage"][CALL_PROVIDER]["calls"] == 2
+    finally:
+        store.close()